@@ -3,27 +3,25 @@ import logging
 import websockets
 from websockets.server import WebSocketServerProtocol
 
+from . import ocpp_json
 from .server import ChargePoint
 from .twc import TWCSimulator
 
 logging.basicConfig(level=logging.DEBUG)  # Change to DEBUG level
 
 async def on_connect(websocket: WebSocketServerProtocol, path: str, twc: TWCSimulator):
-    """Handle incoming WebSocket connection"""
+    """Handle incoming WebSocket connection, websockets closes it once we return"""
+    # Extract serial number from path (remove leading slash)
+    serial = path.lstrip('/')
+    if not serial:
+        logging.error("No serial number provided in path")
+        return
+
     try:
-        # Extract serial number from path (remove leading slash)
-        serial = path.lstrip('/')
-        if not serial:
-            logging.error("No serial number provided in path")
-            return
-            
         cp = ChargePoint(serial, websocket, twc)
         await cp.start()
     except Exception as e:
         logging.error(f"Error in OCPP connection: {e}")
-    finally:
-        if not websocket.closed:
-            await websocket.close()
 
 async def main():
     twc = TWCSimulator()
@@ -49,4 +47,11 @@ async def main():
         await server.wait_closed()
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        # uvloop is not available on Windows, fall back to the default loop
+        pass
+    ocpp_json.install()
     asyncio.run(main())
@@ -1,6 +1,6 @@
 import asyncio
+import async_timeout
 import logging
-import time
 from ocpp.v16 import ChargePoint as cp
 from ocpp.v16 import call
 from ocpp.v16.enums import Action, ChargePointStatus
@@ -9,10 +9,39 @@ from datetime import datetime, timezone
 import math
 import random
 
+try:
+    from . import ocpp_json
+except ImportError:  # run as a script, not as part of the package
+    import ocpp_json
+
 logging.basicConfig(level=logging.INFO)
 
+# Positions of the sampled values in SimulatedChargePoint._sv_template
+_IDX_POWER = 0
+_IDX_V_L1, _IDX_V_L2, _IDX_V_L3 = 1, 2, 3
+_IDX_I_L1, _IDX_I_L2, _IDX_I_L3 = 4, 5, 6
+_IDX_FREQ = 7
+_IDX_E_TOTAL = 8
+_IDX_E_SESSION = 9
+_IDX_TEMP = 10
+
+# Slow power oscillation sin(t * 0.05), advanced by one 5s tick per iteration
+# and resynced from the clock every _POWER_OSC_RESYNC ticks to bound drift
+_POWER_OSC_OMEGA = 0.05
+_POWER_OSC_SIN_STEP = math.sin(5 * _POWER_OSC_OMEGA)
+_POWER_OSC_COS_STEP = math.cos(5 * _POWER_OSC_OMEGA)
+_POWER_OSC_RESYNC = 20
+
+# Upper bound for a single MeterValues round trip, so a slow server
+# cannot hold back the next reading
+_METER_SEND_TIMEOUT = 4.5
+# Hold back MeterValues while more than this is waiting in the websocket
+# write buffer, keeping at most _MAX_PENDING_METER_VALUES unsent readings
+_WRITE_BUFFER_LIMIT = 64 * 1024
+_MAX_PENDING_METER_VALUES = 12
+
 class SimulatedChargePoint(cp):
-    def __init__(self, id, connection):
+    def __init__(self, id, connection, meter_batch_size: int = 1, meter_flush_interval_ms: int = 30000):
         super().__init__(id, connection)
         self.current_power = 0
         self.max_power = 11000  # 11kW
@@ -33,6 +62,43 @@ class SimulatedChargePoint(cp):
         self.transaction_id = None
         self.last_transaction_id = None  # Keep track of last transaction ID
         self.temperature = 18.0  # Add fixed temperature in °C
+        self._power_osc_sin = 0.0
+        self._power_osc_cos = 1.0
+        self._power_osc_ticks = 0
+
+        # Readings are buffered and sent in one MeterValues call once
+        # meter_batch_size is reached or the oldest one waited too long
+        self.meter_batch_size = meter_batch_size
+        self.meter_flush_interval_ms = meter_flush_interval_ms
+        self._pending_meter_values = []
+        self._meter_flush_deadline = None
+
+        # Static part of the sampled values, only "value" changes per tick
+        self._sv_template = [
+            # Power measurements
+            {
+                "value": "0",
+                "context": "Sample.Periodic",
+                "format": "Raw",
+                "measurand": "Power.Active.Import",
+                "unit": "W"
+            },
+            # Phase voltages
+            {"value": "0", "measurand": "Voltage", "unit": "V", "phase": "L1"},
+            {"value": "0", "measurand": "Voltage", "unit": "V", "phase": "L2"},
+            {"value": "0", "measurand": "Voltage", "unit": "V", "phase": "L3"},
+            # Phase currents
+            {"value": "0", "measurand": "Current.Import", "unit": "A", "phase": "L1"},
+            {"value": "0", "measurand": "Current.Import", "unit": "A", "phase": "L2"},
+            {"value": "0", "measurand": "Current.Import", "unit": "A", "phase": "L3"},
+            # Frequency
+            {"value": "0", "measurand": "Frequency", "unit": "Hertz"},
+            # Energy counters
+            {"value": "0", "measurand": "Energy.Active.Import.Register", "unit": "Wh"},
+            {"value": "0", "measurand": "Energy.Active.Import.Interval", "unit": "Wh"},
+            # Temperature
+            {"value": "0", "measurand": "Temperature", "unit": "Celsius"}
+        ]
 
     def set_enabled(self, enabled: bool):
         """Update enabled state and handle EVSE suspension"""
@@ -89,16 +155,15 @@ class SimulatedChargePoint(cp):
         await self.send_status_notification(ChargePointStatus.suspended_ev)
         logging.info("Charging stopped")
 
-    def get_grid_values(self):
+    def get_grid_values(self, now_ts: float):
         """Simulate realistic grid variations"""
-        now = datetime.now(timezone.utc).timestamp()
-        t = now - self.last_update
+        t = now_ts - self.last_update
 
         # Voltage variation: ±5% with slow oscillation and noise
         voltage_variation = (
             math.sin(t * 0.1) * 2.0 +                # Slow oscillation
             math.sin(t * 1.0) * 1.0 +                # Medium oscillation
-            random.uniform(-0.5, 0.5)                # Random noise
+            (random.random() - 0.5)                  # Random noise
         )
         voltage = self.base_voltage + voltage_variation
 
@@ -107,31 +172,89 @@ class SimulatedChargePoint(cp):
         # Frequency variation: ±0.1Hz with very slow oscillation
         freq_variation = (
             math.sin(t * 0.05) * 0.1 +              # Very slow oscillation
-            random.uniform(-0.01, 0.01)              # Tiny random noise
+            (random.random() - 0.5) * 0.02           # Tiny random noise
         )
         frequency = self.base_frequency + freq_variation
 
         return voltage, current, frequency
 
+    def get_power_oscillation(self, now_ts: float):
+        """Advance the slow power oscillation by one tick"""
+        if self._power_osc_ticks == 0:
+            angle = now_ts * _POWER_OSC_OMEGA
+            self._power_osc_sin = math.sin(angle)
+            self._power_osc_cos = math.cos(angle)
+        else:
+            s, c = self._power_osc_sin, self._power_osc_cos
+            self._power_osc_sin = s * _POWER_OSC_COS_STEP + c * _POWER_OSC_SIN_STEP
+            self._power_osc_cos = c * _POWER_OSC_COS_STEP - s * _POWER_OSC_SIN_STEP
+        self._power_osc_ticks = (self._power_osc_ticks + 1) % _POWER_OSC_RESYNC
+        return self._power_osc_sin
+
+    def _hold_meter_values(self, meter_value: list):
+        """Put unsent readings back in front of the buffer, dropping the oldest ones"""
+        for reading in meter_value:
+            if reading["sampled_value"] is self._sv_template:
+                reading["sampled_value"] = [dict(v) for v in self._sv_template]
+        self._pending_meter_values[:0] = meter_value
+        del self._pending_meter_values[:-_MAX_PENDING_METER_VALUES]
+
+    async def flush_meter_values(self):
+        """Send all buffered readings in a single MeterValues call"""
+        meter_value, self._pending_meter_values = self._pending_meter_values, []
+        self._meter_flush_deadline = None
+
+        transport = self._connection.transport
+        if transport is not None and transport.get_write_buffer_size() > _WRITE_BUFFER_LIMIT:
+            logging.warning("Websocket backpressure, holding back MeterValues")
+            self._hold_meter_values(meter_value)
+            return None
+
+        # Another call still waiting for its response holds the call lock,
+        # the readings would not go out before the timeout
+        if self._call_lock.locked():
+            logging.warning("Previous call still pending, holding back MeterValues")
+            self._hold_meter_values(meter_value)
+            return None
+
+        try:
+            # Unlike wait_for on Python < 3.12, this runs the call in the current
+            # task, so the free lock is taken and the frame written right away
+            async with async_timeout.timeout(_METER_SEND_TIMEOUT):
+                return await self.call(call.MeterValuesPayload(
+                    connector_id=1,
+                    meter_value=meter_value
+                ))
+        except asyncio.TimeoutError:
+            # The frame was sent, resending it would only duplicate readings
+            # while the server is slow
+            logging.warning("MeterValues sent but not answered in time, not resending")
+            return None
+
     async def simulate_power_draw(self):
         """Simulate realistic power consumption"""
         # Start charging session in background
         asyncio.create_task(self.start_charging_session())
         
+        # Schedule ticks against absolute deadlines so processing time does not add drift
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + 5.0
+
         while True:
-            voltage, current, frequency = self.get_grid_values()
             now = datetime.now(timezone.utc)
-            self.last_update = now.timestamp()
+            now_ts = now.timestamp()
+            voltage, current, frequency = self.get_grid_values(now_ts)
+            time_factor = self.get_power_oscillation(now_ts)  # Slower oscillation
+            self.last_update = now_ts
             
             if self.charging and self.vehicle_connected:
                 # Base power calculation with realistic variations
                 nominal_power = self.current * voltage * 3  # 3-phase
                 
                 # Add load-based variations
-                time_factor = math.sin(datetime.now().timestamp() * 0.05)  # Slower oscillation
                 power_variation = (
                     time_factor * nominal_power * 0.02 +  # 2% slow power oscillation
-                    random.uniform(-50, 50)               # Random noise ±50W
+                    (random.random() - 0.5) * 100         # Random noise ±50W
                 )
                 
                 self.current_power = min(nominal_power + power_variation, self.max_power)
@@ -147,98 +270,46 @@ class SimulatedChargePoint(cp):
                 self.current_power = 0
                 current = 0
 
-            # Build meter values with per-phase measurements
-            sampled_values = [
-                # Power measurements
-                {
-                    "value": str(round(self.current_power, 2)),
-                    "context": "Sample.Periodic",
-                    "format": "Raw",
-                    "measurand": "Power.Active.Import",
-                    "unit": "W"
-                },
-                # Phase voltages
-                {
-                    "value": str(round(voltage, 2)),
-                    "measurand": "Voltage",
-                    "unit": "V",
-                    "phase": "L1"
-                },
-                {
-                    "value": str(round(voltage, 2)),
-                    "measurand": "Voltage",
-                    "unit": "V",
-                    "phase": "L2"
-                },
-                {
-                    "value": str(round(voltage, 2)),
-                    "measurand": "Voltage",
-                    "unit": "V",
-                    "phase": "L3"
-                },
-                # Phase currents
-                {
-                    "value": str(round(current, 2)),
-                    "measurand": "Current.Import",
-                    "unit": "A",
-                    "phase": "L1"
-                },
-                {
-                    "value": str(round(current, 2)),
-                    "measurand": "Current.Import",
-                    "unit": "A",
-                    "phase": "L2"
-                },
-                {
-                    "value": str(round(current, 2)),
-                    "measurand": "Current.Import",
-                    "unit": "A",
-                    "phase": "L3"
-                },
-                # Frequency
-                {
-                    "value": str(round(frequency, 3)),
-                    "measurand": "Frequency",
-                    "unit": "Hertz"
-                },
-                # Energy counters
-                {
-                    "value": str(round(self.total_energy_wh, 2)),
-                    "measurand": "Energy.Active.Import.Register",
-                    "unit": "Wh"
-                },
-                {
-                    "value": str(round(self.session_energy, 2)),
-                    "measurand": "Energy.Active.Import.Interval",
-                    "unit": "Wh"
-                },
-                # Add temperature measurement
-                {
-                    "value": str(self.temperature),
-                    "measurand": "Temperature",
-                    "unit": "Celsius"
-                }
-            ]
+            # Update meter values with per-phase measurements
+            sv = self._sv_template
+            sv[_IDX_POWER]["value"] = f"{self.current_power:.2f}"
+            sv[_IDX_V_L1]["value"] = sv[_IDX_V_L2]["value"] = sv[_IDX_V_L3]["value"] = f"{voltage:.2f}"
+            sv[_IDX_I_L1]["value"] = sv[_IDX_I_L2]["value"] = sv[_IDX_I_L3]["value"] = f"{current:.2f}"
+            sv[_IDX_FREQ]["value"] = f"{frequency:.3f}"
+            sv[_IDX_E_TOTAL]["value"] = f"{self.total_energy_wh:.2f}"
+            sv[_IDX_E_SESSION]["value"] = f"{self.session_energy:.2f}"
+            sv[_IDX_TEMP]["value"] = str(self.temperature)
+
+            # Buffered readings need their own copy, the template changes every tick
+            self._pending_meter_values.append({
+                "timestamp": now.isoformat(),
+                "sampled_value": sv if self.meter_batch_size <= 1 else [dict(v) for v in sv]
+            })
+            loop_time = loop.time()
+            if self._meter_flush_deadline is None:
+                self._meter_flush_deadline = loop_time + self.meter_flush_interval_ms / 1000
 
             # Send meter values
             try:
-                response = await self.call(call.MeterValuesPayload(
-                    connector_id=1,
-                    meter_value=[{
-                        "timestamp": now.isoformat(),
-                        "sampled_value": sampled_values
-                    }]
-                ))
+                if (len(self._pending_meter_values) >= self.meter_batch_size
+                        or loop_time >= self._meter_flush_deadline):
+                    await self.flush_meter_values()
                 
                 if self.charging:
-                    logging.info(f"Charging: {round(self.current_power/1000, 2)} kW, "
-                               f"V(L1/L2/L3): {round(voltage,1)}V, F: {round(frequency,2)}Hz, "
-                               f"Session: {round(self.session_energy/1000, 2)} kWh")
+                    logging.info(f"Charging: {self.current_power/1000:.2f} kW, "
+                               f"V(L1/L2/L3): {voltage:.1f}V, F: {frequency:.2f}Hz, "
+                               f"Session: {self.session_energy/1000:.2f} kWh")
                     
             except Exception as e:
                 logging.error(f"Error sending MeterValues: {e}")
 
-            await asyncio.sleep(5)
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                next_tick += 5.0
+            else:
+                # Fell behind, start a fresh interval instead of bursting to catch up
+                next_tick = loop.time() + 5.0
 
     async def start(self):
         """Handle OCPP messages"""
@@ -300,15 +371,11 @@ async def main():
 
             # Separate heartbeat loop
             heartbeat_interval = 30
-            last_heartbeat = 0
             
             while True:
                 try:
-                    now = time.time()
-                    if now - last_heartbeat >= heartbeat_interval:
-                        await cp.send_heartbeat()
-                        last_heartbeat = now
-                    await asyncio.sleep(1)  # Check heartbeat every second
+                    await cp.send_heartbeat()
+                    await asyncio.sleep(heartbeat_interval)
                 except Exception as e:
                     logging.error(f"Error in main loop: {e}")
                     break
@@ -323,6 +390,7 @@ async def main():
         logging.error(f"Connection error: {e}")
 
 if __name__ == "__main__":
+    ocpp_json.install()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,47 @@
+import decimal
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # Same conversion as ocpp.messages._DecimalEncoder
+    if isinstance(obj, decimal.Decimal):
+        return float("%.1f" % obj)
+    raise TypeError
+
+
+class _OrjsonShim:
+    """Drop-in for the json module as used by ocpp.messages"""
+    JSONDecodeError = json.JSONDecodeError
+    JSONEncoder = json.JSONEncoder
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        try:
+            return orjson.dumps(obj, default=_default).decode()
+        except TypeError:
+            # Fall back to the stdlib for anything orjson cannot encode
+            return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        # parse_float etc. are only supported by the stdlib
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def install():
+    """Use orjson for encoding and decoding OCPP messages if it is installed"""
+    if orjson is None:
+        return False
+
+    import ocpp.messages
+    ocpp.messages.json = _OrjsonShim
+    logging.debug("Using orjson for OCPP messages")
+    return True
@@ -4,10 +4,30 @@ from ocpp.v16.enums import Action, RegistrationStatus, AuthorizationStatus
 from ocpp.v16 import call_result
 from datetime import datetime, timezone
 import logging
+import sys
 from dataclasses import dataclass
 from typing import Dict, Optional
 
-@dataclass
+# dataclass(slots=True) is only available from Python 3.10 on
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# Index of each phase in the per-phase value lists
+_PHASE_IDX = {'L1': 0, 'L2': 1, 'L3': 2, 'N': 3}
+
+# Measurands we process, mapped to the action taken in on_meter_values
+_MEASURAND_ACTIONS = {
+    'Current.Import': 'current_phase',
+    'Voltage': 'voltage_phase',
+    'Power.Active.Import': 'power_phase',
+    'Frequency': 'freq',
+    'Energy.Active.Import.Register': 'total_e',
+    'Energy.Active.Import.Interval': 'session_e',
+    'Temperature': 'temp',
+    'Current.Offered': 'current_off',
+    'Power.Offered': 'power_off',
+}
+
+@dataclass(**_DATACLASS_SLOTS)
 class ChargingSession:
     id_tag: str
     transaction_id: int
@@ -22,6 +42,19 @@ class ChargePoint(cp):
         self.twc = twc
         self.transaction_id = None
         self.last_session: Optional[ChargingSession] = None  # Store only the last session
+        # Reused reply payloads, the ocpp library copies them with asdict()
+        # right after the handler returns, so no reference is kept
+        self._boot_reply = call_result.BootNotificationPayload(
+            current_time="",
+            interval=300,
+            status=RegistrationStatus.accepted
+        )
+        self._heartbeat_reply = call_result.HeartbeatPayload(current_time="")
+        self._status_reply = call_result.StatusNotificationPayload()
+        self._authorize_reply = call_result.AuthorizePayload(
+            id_tag_info={"status": AuthorizationStatus.accepted}
+        )
+        self._meter_values_reply = call_result.MeterValuesPayload()
         self.twc.set_ocpp_connected(True)
 
     async def start(self):
@@ -41,17 +74,13 @@ class ChargePoint(cp):
 
     @on(Action.BootNotification)
     def on_boot_notification(self, charge_point_vendor: str, charge_point_model: str, **kwargs):
-        return call_result.BootNotificationPayload(
-            current_time=self.get_current_time(),
-            interval=300,
-            status=RegistrationStatus.accepted
-        )
+        self._boot_reply.current_time = self.get_current_time()
+        return self._boot_reply
 
     @on(Action.Heartbeat)
     def on_heartbeat(self):
-        return call_result.HeartbeatPayload(
-            current_time=self.get_current_time()
-        )
+        self._heartbeat_reply.current_time = self.get_current_time()
+        return self._heartbeat_reply
 
     @on(Action.StatusNotification)
     def on_status_notification(self, connector_id: int, error_code: str, status: str, **kwargs):
@@ -66,26 +95,20 @@ class ChargePoint(cp):
                 self.twc.set_vehicle_connected(True)
             elif status == "SuspendedEVSE":
                 # Car is connected but not charging (contactors open)
-                self.twc.set_vehicle_connected(True)
-                self.twc.vitals.evse_state = 2  # ready
-                self.twc.vitals.contactor_closed = False
+                self.twc.set_suspended()
             elif status == "SuspendedEV":
                 # Car requested charging stop
-                self.twc.set_vehicle_connected(True)
-                self.twc.vitals.evse_state = 2  # ready
-                self.twc.vitals.contactor_closed = False
+                self.twc.set_suspended()
             else:
                 self.twc.set_vehicle_connected(False)
             
-        return call_result.StatusNotificationPayload()
+        return self._status_reply
 
     @on(Action.Authorize)
     def on_authorize(self, id_tag: str):
         """Log authorization requests but always accept"""
         logging.info(f"Authorization request from charge point: {id_tag}")
-        return call_result.AuthorizePayload(
-            id_tag_info={"status": AuthorizationStatus.accepted}
-        )
+        return self._authorize_reply
 
     @on(Action.StartTransaction)
     def on_start_transaction(self, connector_id: int, id_tag: str, meter_start: int, timestamp: str, **kwargs):
@@ -99,21 +122,24 @@ class ChargePoint(cp):
 
         # Store current total energy as start point
         total_energy_start = self.twc.vitals.total_energy_wh
-        session_energy = 0.0
 
         # Check if we have a previous session with same ID
         if self.last_session and self.last_session.id_tag == id_tag:
             logging.info(f"Restoring previous session for {id_tag} with {self.last_session.session_energy}Wh")
-            session_energy = self.last_session.session_energy
-
-        self.last_session = ChargingSession(
-            id_tag=id_tag,
-            transaction_id=self.transaction_id,
-            meter_start=meter_start,
-            start_time=timestamp_dt,
-            total_energy_start=total_energy_start,
-            session_energy=session_energy
-        )
+            # Keep the accumulated session energy, only restart the transaction
+            self.last_session.transaction_id = self.transaction_id
+            self.last_session.meter_start = meter_start
+            self.last_session.start_time = timestamp_dt
+            self.last_session.total_energy_start = total_energy_start
+        else:
+            self.last_session = ChargingSession(
+                id_tag=id_tag,
+                transaction_id=self.transaction_id,
+                meter_start=meter_start,
+                start_time=timestamp_dt,
+                total_energy_start=total_energy_start,
+                session_energy=0.0
+            )
 
         logging.info(f"Transaction started: id={self.transaction_id}, connector={connector_id}, "
                     f"id_tag={id_tag}, total_start={total_energy_start}Wh")
@@ -136,7 +162,10 @@ class ChargePoint(cp):
     @on(Action.MeterValues)
     def on_meter_values(self, connector_id: int, meter_value: list, **kwargs):
         if not meter_value:
-            return call_result.MeterValuesPayload()
+            return self._meter_values_reply
+
+        # Skip formatting the per-reading log lines when they would be dropped
+        log_values = logging.getLogger().isEnabledFor(logging.INFO)
 
         try:
             for reading in meter_value:
@@ -144,9 +173,10 @@ class ChargePoint(cp):
                 timestamp = reading.get('timestamp')
                 transaction_id = kwargs.get('transaction_id')
                 
-                currents = {'L1': 0, 'L2': 0, 'L3': 0, 'N': 0}
-                voltages = {'L1': 0, 'L2': 0, 'L3': 0, 'N': 0}
-                powers = {'L1': 0, 'L2': 0, 'L3': 0}  # Per-phase power
+                # Per-phase values, indexed by _PHASE_IDX
+                currents = [0.0] * 4
+                voltages = [0.0] * 4
+                powers = [0.0] * 4
                 frequency = 50.0
                 session_energy = 0
                 total_energy = 0
@@ -158,36 +188,43 @@ class ChargePoint(cp):
                 
                 # Process values
                 for sv in sampled_values:
-                    measurand = sv.get('measurand', '')
-                    value = float(sv.get('value', '0'))
-                    phase = sv.get('phase', '')
-                    
-                    if measurand == 'Current.Import' and phase:
-                        currents[phase] = value
-                    elif measurand == 'Current.Offered':
-                        current_offered = value
-                    elif measurand == 'Voltage' and phase:
-                        voltages[phase] = value
-                    elif measurand == 'Power.Active.Import' and phase:
-                        powers[phase] = value
-                    elif measurand == 'Power.Offered':
-                        power_offered = value
-                    elif measurand == 'Frequency':
+                    action = _MEASURAND_ACTIONS.get(sv.get('measurand'))
+                    if action is None:
+                        continue
+                    raw = sv.get('value')
+                    value = float(raw) if raw is not None else 0.0
+
+                    if action.endswith('_phase'):
+                        phase = _PHASE_IDX.get(sv.get('phase'))
+                        if phase is None:
+                            continue
+                        if action == 'current_phase':
+                            currents[phase] = value
+                        elif action == 'voltage_phase':
+                            voltages[phase] = value
+                        else:
+                            powers[phase] = value
+                    elif action == 'freq':
                         frequency = value
-                    elif measurand == 'Energy.Active.Import.Register':
+                    elif action == 'total_e':
                         total_energy = value
-                    elif measurand == 'Energy.Active.Import.Interval':
+                    elif action == 'session_e':
                         session_energy = value
                         interval_energy_reported = True
-                    elif measurand == 'Temperature':
+                    elif action == 'temp':
                         temperature = value
+                    elif action == 'current_off':
+                        current_offered = value
+                    else:
+                        power_offered = value
 
                 # Log processed values with additional info
-                logging.info(f"Power per phase: L1={powers['L1']}W, L2={powers['L2']}W, L3={powers['L3']}W")
-                logging.info(f"Current: (L1={currents['L1']}A, L2={currents['L2']}A, L3={currents['L3']}A) Offered={current_offered}A")
-                logging.info(f"Voltage: (L1={voltages['L1']}V, L2={voltages['L2']}V, L3={voltages['L3']}V)")
-                logging.info(f"Frequency={frequency}Hz, Temperature={temperature}°C")
-                logging.info(f"Energy: Session={session_energy}Wh, Total={total_energy}Wh, Power Offered: {power_offered}W")
+                if log_values:
+                    logging.info(f"Power per phase: L1={powers[0]}W, L2={powers[1]}W, L3={powers[2]}W")
+                    logging.info(f"Current: (L1={currents[0]}A, L2={currents[1]}A, L3={currents[2]}A) Offered={current_offered}A")
+                    logging.info(f"Voltage: (L1={voltages[0]}V, L2={voltages[1]}V, L3={voltages[2]}V)")
+                    logging.info(f"Frequency={frequency}Hz, Temperature={temperature}°C")
+                    logging.info(f"Energy: Session={session_energy}Wh, Total={total_energy}Wh, Power Offered: {power_offered}W")
 
                 # Initialize a new session if none exists but we have a transaction
                 if not self.last_session and transaction_id:
@@ -211,11 +248,12 @@ class ChargePoint(cp):
                 if not interval_energy_reported and self.last_session:
                     session_energy = total_energy - self.last_session.total_energy_start
                     self.last_session.session_energy = max(0, session_energy)
-                    logging.info(f"Computed session energy: {session_energy}Wh from total={total_energy}Wh - start={self.last_session.total_energy_start}Wh")
+                    if log_values:
+                        logging.info(f"Computed session energy: {session_energy}Wh from total={total_energy}Wh - start={self.last_session.total_energy_start}Wh")
 
                 # Update TWC with latest values
                 self.twc.update_from_client(
-                    power=sum(powers.values()),
+                    power=sum(powers),
                     currents=currents,
                     voltages=voltages,
                     frequency=frequency,
@@ -228,7 +266,7 @@ class ChargePoint(cp):
         except Exception as e:
             logging.error(f"Error processing meter values: {e}", exc_info=True)
         
-        return call_result.MeterValuesPayload()
+        return self._meter_values_reply
 
     @on(Action.DataTransfer)
     def on_data_transfer(self, vendor_id: str, message_id: str, data: str):
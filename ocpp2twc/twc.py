@@ -1,12 +1,83 @@
 import asyncio
 import json
 import logging
+import sys
+import time
 from aiohttp import web
-from dataclasses import dataclass, field
-from typing import List, Any, Dict
+from dataclasses import dataclass, field, fields
+from typing import List, Any, Dict, Sequence
 from datetime import datetime, timezone
 
-@dataclass
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from ciso8601 import parse_datetime as _parse_iso
+except ImportError:
+    _parse_iso = datetime.fromisoformat
+
+# Plausible ISO 8601 timestamp lengths, from "2024-01-01T00:00:00" up to
+# fractional seconds with a UTC offset; anything else is not worth parsing
+_ISO_MIN_LEN, _ISO_MAX_LEN = 19, 35
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to JSON bytes, using orjson if it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+def _json_response(body: bytes, status: int = 200):
+    """Wrap an already serialized JSON body in a response, bypassing aiohttp's encoder"""
+    return web.Response(body=body, status=status, headers=_CORS_HEADERS, content_type='application/json')
+
+# EVSE states, see TWCSimulator.EVSE_STATES
+_UNKNOWN, _DISABLED, _READY, _CHARGING, _ERROR = 0, 1, 2, 3, 4
+
+# What happens to charging_start_time on a transition
+_TIMER_KEEP, _TIMER_START, _TIMER_CLEAR = 0, 1, 2
+
+# (event, evse_state, vehicle_connected) -> (new evse_state, contactor_closed, timer),
+# a contactor_closed of None leaves it unchanged, missing keys are rejected transitions
+def _build_transitions():
+    """Build the EVSE state transition table"""
+    transitions = {}
+    for state in (_UNKNOWN, _DISABLED, _READY, _CHARGING, _ERROR):
+        for connected in (False, True):
+            transitions[('disable', state, connected)] = (_DISABLED, False, _TIMER_CLEAR)
+            transitions[('error', state, connected)] = (_ERROR, False, _TIMER_CLEAR)
+            transitions[('offline', state, connected)] = (_UNKNOWN, False, _TIMER_CLEAR)
+            if state != _ERROR:  # error sticks until cleared
+                transitions[('enable', state, connected)] = (
+                    (_CHARGING, True, _TIMER_START) if connected else (_READY, None, _TIMER_KEEP))
+
+        # For vehicle events, connected is the new connection state
+        transitions[('vehicle', state, False)] = (
+            state if state in (_DISABLED, _ERROR) else _READY, False, _TIMER_CLEAR)
+        transitions[('vehicle', state, True)] = (
+            (_CHARGING, True, _TIMER_START) if state == _READY else (state, None, _TIMER_KEEP))
+        # Vehicle stays connected with the contactor open, a vehicle plugged
+        # into a ready EVSE starts the session timer like a 'vehicle' event
+        transitions[('suspend', state, True)] = (
+            _READY, False, _TIMER_START if state == _READY else _TIMER_KEEP)
+    return transitions
+
+_TRANSITIONS = _build_transitions()
+
+# Pilot signal voltage per EVSE state, 0V for all other states
+_PILOT_V_LOOKUP = {_READY: 12.0, _CHARGING: 12.0}
+
+# Vitals only gets slots where dataclass supports them (Python 3.10+)
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class Vitals:
     contactor_closed: bool = False
     vehicle_connected: bool = False
@@ -37,7 +108,13 @@ class Vitals:
     current_alerts: List[Any] = field(default_factory=list)
 
     def to_dict(self):
-        return {k: v if v is not None else [] for k, v in self.__dict__.items()}
+        d = {k: getattr(self, k) for k in _VITALS_FIELDS}
+        # current_alerts is the only field that may be None
+        if d['current_alerts'] is None:
+            d['current_alerts'] = []
+        return d
+
+_VITALS_FIELDS = tuple(f.name for f in fields(Vitals))
 
 class TWCSimulator:
     EVSE_STATES = {
@@ -52,133 +129,171 @@ class TWCSimulator:
         self.vitals = Vitals()
         self.max_power = 11000  # 11kW
         self.start_time = datetime.now(timezone.utc)
-        self.charging_start_time = None
+        self._start_monotonic = time.monotonic()  # Uptime is not affected by clock changes
+        self.charging_start_time = None  # Unix timestamp
         self.ocpp_connected = False
-        self.last_seen = datetime.now(timezone.utc).timestamp()
+        self.last_seen = time.time()
+        self._pending_update = None  # Latest client values not yet applied to vitals
+        self._offline_body = _json_dumps({
+            "error": "OCPP client not connected",
+            "state": self.EVSE_STATES[_UNKNOWN],
+            "status": "offline"
+        })
+        self._rebuild_json()
 
     @property
     def charging(self):
         """Derive charging state from vitals"""
-        return self.vitals.contactor_closed and self.vitals.evse_state == 3
+        return self.vitals.contactor_closed and self.vitals.evse_state == _CHARGING
 
-    def set_enabled(self, enabled: bool):
-        """Update enabled state"""
-        if enabled:
-            if self.vitals.evse_state == 4:  # error
-                return False
-            if self.vitals.vehicle_connected:
-                self.vitals.evse_state = 3  # charging
-                self.vitals.contactor_closed = True
-                if not self.charging_start_time:
-                    self.charging_start_time = datetime.now(timezone.utc)
-            else:
-                self.vitals.evse_state = 2  # ready
-        else:
-            self.vitals.evse_state = 1  # disabled
-            self.vitals.contactor_closed = False
+    def _rebuild_json(self):
+        """Serialize vitals for the TWC3 API, called by every method that changes them"""
+        self._vitals_bytes = _json_dumps(self.vitals.to_dict())
+
+    def _transition(self, event: str, connected: bool):
+        """Apply a state machine event, returns False if it is not allowed in the current state"""
+        transition = _TRANSITIONS.get((event, self.vitals.evse_state, connected))
+        if transition is None:
+            return False
+
+        self.vitals.evse_state, contactor_closed, timer = transition
+        if contactor_closed is not None:
+            self.vitals.contactor_closed = contactor_closed
+        if timer == _TIMER_START:
+            if not self.charging_start_time:
+                self.charging_start_time = time.time()
+        elif timer == _TIMER_CLEAR:
             self.charging_start_time = None
+        self._rebuild_json()
         return True
 
+    def set_enabled(self, enabled: bool):
+        """Update enabled state"""
+        return self._transition('enable' if enabled else 'disable', self.vitals.vehicle_connected)
+
+    def _update_vehicle_connected(self, connected: bool):
+        """Store the vehicle connection state, the caller applies the transition"""
+        if connected != self.vitals.vehicle_connected:
+            logging.info(f"Vehicle {'connected' if connected else 'disconnected'}")
+        self.vitals.vehicle_connected = connected
+
     def set_vehicle_connected(self, connected: bool):
         """Update vehicle connection state"""
-        was_connected = self.vitals.vehicle_connected
-        self.vitals.vehicle_connected = connected
-        
-        if connected != was_connected:
-            logging.info(f"Vehicle {'connected' if connected else 'disconnected'}")
-        
-        if not connected:
-            self.vitals.contactor_closed = False
-            self.charging_start_time = None
-            if self.vitals.evse_state != 1 and self.vitals.evse_state != 4:  # if not disabled or error
-                self.vitals.evse_state = 2  # go to ready
-        elif self.vitals.evse_state == 2:  # if in ready state
-            self.vitals.evse_state = 3  # start charging
-            self.vitals.contactor_closed = True
-            if not self.charging_start_time:
-                self.charging_start_time = datetime.now(timezone.utc)
-        
+        self._update_vehicle_connected(connected)
+        self._transition('vehicle', connected)
         return True
 
     def set_error(self, has_error: bool):
         """Set error state"""
         if has_error:
-            self.vitals.evse_state = 4  # error
-            self.vitals.contactor_closed = False
-            self.charging_start_time = None
+            self._transition('error', self.vitals.vehicle_connected)
         else:
-            self.vitals.evse_state = 1  # start in disabled state
+            self.vitals.evse_state = _DISABLED  # start in disabled state
             self.set_enabled(True)  # then try to enable
 
+    def set_suspended(self):
+        """Vehicle connected but not charging (contactor open)"""
+        self._update_vehicle_connected(True)
+        return self._transition('suspend', True)
+
     def set_ocpp_connected(self, connected: bool):
         """Update OCPP connection state"""
         self.ocpp_connected = connected
         if connected:
-            self.last_seen = datetime.now(timezone.utc).timestamp()
+            self.last_seen = time.time()
         else:
-            self.vitals.evse_state = 0  # unknown
-            self.vitals.contactor_closed = False
-            self.charging_start_time = None
+            self._transition('offline', self.vitals.vehicle_connected)
 
-    def update_from_client(self, power: float, currents: dict, voltages: dict, 
+    def update_from_client(self, power: float, currents: Sequence[float], voltages: Sequence[float],
                          frequency: float = 50.0, session_energy: float = 0,
                          total_energy: float = 0, pcba_temp_c: float = 20, timestamp: str = None):
-        """Update vitals with values from OCPP client"""
-        now = datetime.now(timezone.utc)
+        """Update vitals with values from OCPP client (per-phase lists ordered L1, L2, L3, N)"""
+        # Updates arriving within one event loop iteration (e.g. a MeterValues
+        # message with several readings) are coalesced, only the latest is applied
+        already_scheduled = self._pending_update is not None
+        self._pending_update = (power, currents, voltages, frequency, session_energy,
+                                total_energy, pcba_temp_c, timestamp)
+        if not already_scheduled:
+            try:
+                asyncio.get_running_loop().call_soon(self._apply_pending_update)
+            except RuntimeError:  # no event loop, apply right away
+                self._apply_pending_update()
+        return True
+
+    def _apply_pending_update(self):
+        """Apply the latest queued client update, if any"""
+        update, self._pending_update = self._pending_update, None
+        if update is not None:
+            self._apply_update(*update)
+
+    def _apply_update(self, power, currents, voltages, frequency, session_energy,
+                      total_energy, pcba_temp_c, timestamp):
+        """Write values from OCPP client into vitals"""
+        now_ts = time.time()
+        vitals = self.vitals  # bind once, every field below is written through it
         
         # Update all electrical values directly from client
-        self.vitals.currentA_a = currents.get('L1', 0)
-        self.vitals.currentB_a = currents.get('L2', 0)
-        self.vitals.currentC_a = currents.get('L3', 0)
-        self.vitals.currentN_a = currents.get('N', 0)
+        a, b, c, n = currents
+        vitals.currentA_a = a
+        vitals.currentB_a = b
+        vitals.currentC_a = c
+        vitals.currentN_a = n
         
         # Sum of phase currents for vehicle total
-        self.vitals.vehicle_current_a = sum(
-            c for c in [self.vitals.currentA_a, 
-                       self.vitals.currentB_a, 
-                       self.vitals.currentC_a] if c > 0
-        )
+        vitals.vehicle_current_a = (a if a > 0 else 0) + (b if b > 0 else 0) + (c if c > 0 else 0)
         
         # Update voltages per phase
-        self.vitals.voltageA_v = voltages.get('L1', 230.0)
-        self.vitals.voltageB_v = voltages.get('L2', 230.0)
-        self.vitals.voltageC_v = voltages.get('L3', 230.0)
+        va, vb, vc, _ = voltages
+        vitals.voltageA_v = va
+        vitals.voltageB_v = vb
+        vitals.voltageC_v = vc
         
-        # Calculate grid voltage as average of phases
-        active_voltages = [v for v in [self.vitals.voltageA_v, 
-                                     self.vitals.voltageB_v, 
-                                     self.vitals.voltageC_v] if v > 2.0]
-        self.vitals.grid_v = sum(active_voltages) / len(active_voltages) if active_voltages else 230.0
-        self.vitals.grid_hz = frequency
+        # Calculate grid voltage as average of active phases
+        total_v = 0
+        active = 0
+        if va > 2.0:
+            total_v += va
+            active += 1
+        if vb > 2.0:
+            total_v += vb
+            active += 1
+        if vc > 2.0:
+            total_v += vc
+            active += 1
+        vitals.grid_v = total_v / active if active else 230.0
+        vitals.grid_hz = frequency
         
         # Update both energy counters
-        self.vitals.session_energy_wh = session_energy
-        self.vitals.total_energy_wh = total_energy
+        vitals.session_energy_wh = session_energy
+        vitals.total_energy_wh = total_energy
         
         # Update session time if we're charging
         if self.charging_start_time:
-            if timestamp:
+            # Only attempt to parse strings of plausible ISO 8601 length
+            if timestamp and _ISO_MIN_LEN <= len(timestamp) <= _ISO_MAX_LEN:
                 try:
-                    charge_time = datetime.fromisoformat(timestamp)
-                    self.vitals.session_s = int((charge_time - self.charging_start_time).total_seconds())
+                    charge_time = _parse_iso(timestamp)
+                    vitals.session_s = int(charge_time.timestamp() - self.charging_start_time)
                 except ValueError:
-                    self.vitals.session_s = int((now - self.charging_start_time).total_seconds())
+                    vitals.session_s = int(now_ts - self.charging_start_time)
+            else:
+                vitals.session_s = int(now_ts - self.charging_start_time)
         else:
-            self.vitals.session_s = 0
+            vitals.session_s = 0
             
         # Update pilot signal values based on state
-        self.vitals.pilot_high_v = 12.0 if self.vitals.evse_state in (2, 3) else 0.0
-        self.vitals.pilot_low_v = 12.0 if self.vitals.evse_state in (2, 3) else 0.0
-        self.vitals.relay_coil_v = 12.0 if self.vitals.contactor_closed else 0.0
+        vitals.pilot_high_v = vitals.pilot_low_v = _PILOT_V_LOOKUP.get(vitals.evse_state, 0.0)
+        vitals.relay_coil_v = 12.0 if vitals.contactor_closed else 0.0
         
         # Update uptime
-        self.vitals.uptime_s = int(now.timestamp() - self.start_time.timestamp())
+        vitals.uptime_s = int(time.monotonic() - self._start_monotonic)
         
         # Fixed temperature values
-        self.vitals.pcba_temp_c = pcba_temp_c
-        self.vitals.handle_temp_c = 20.0
-        self.vitals.mcu_temp_c = 20.0
+        vitals.pcba_temp_c = pcba_temp_c
+        vitals.handle_temp_c = 20.0
+        vitals.mcu_temp_c = 20.0
         
+        self._rebuild_json()
         return True
 
     def set_power(self, watts: int):
@@ -190,34 +305,27 @@ class TWCSimulator:
 
     async def handle_twc3_request(self, request):
         """Handle TWC3 HTTP API requests"""
-        if request.method == 'GET':
-            headers = {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            }
-
-            if not self.ocpp_connected:
-                response = {
-                    "error": "OCPP client not connected",
-                    "state": self.EVSE_STATES.get(0, "unknown"),
-                    "status": "offline"
-                }
-                return web.json_response(response, headers=headers, status=503)
-
-            # Log vitals for debugging
-            logging.debug(f"Current vitals state: {self.vitals.to_dict()}")
-            return web.json_response(self.vitals.to_dict(), headers=headers)
-
-        return web.Response(status=405)
+        if request.method != 'GET':
+            return web.Response(status=405)
+
+        if not self.ocpp_connected:
+            return _json_response(self._offline_body, status=503)
+
+        self._apply_pending_update()
+
+        # Log vitals for debugging, only build the dict if it will be logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Current vitals state: %s", self.vitals.to_dict())
+        return _json_response(self._vitals_bytes)
 
     async def start_twc3_server(self):
         """Start TWC3 HTTP server"""
         app = web.Application()
         app.router.add_route('*', '/api/1/vitals', self.handle_twc3_request)
         
-        runner = web.AppRunner(app, access_log=None)
+        # Keep idle connections open so polling clients can reuse them
+        runner = web.AppRunner(app, access_log=None, keepalive_timeout=75)
         await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', 8080)
+        site = web.TCPSite(runner, '0.0.0.0', 8080, backlog=256, reuse_address=True)
         await site.start()
         return site